@@ -1,13 +1,42 @@
 import sys
 import os
 from PySide6.QtWidgets import QApplication
+from PySide6.QtCore import QElapsedTimer
 from src.ui import MainWindow
 from src.utils import setup_logger
 
+# --profile-events logs every event that takes longer than this to deliver
+SLOW_EVENT_MS = 5
+
+class ProfiledApp(QApplication):
+    """QApplication that logs slow event deliveries, for finding UI hot spots."""
+
+    def __init__(self, argv, logger):
+        super().__init__(argv)
+        self.logger = logger
+
+    def notify(self, receiver, event):
+        # A timer per call, since notify() re-enters for nested events
+        timer = QElapsedTimer()
+        timer.start()
+        ret = super().notify(receiver, event)
+        elapsed = timer.elapsed()
+        if elapsed > SLOW_EVENT_MS:
+            self.logger.info(
+                f"Slow event {event.type()} on "
+                f"{type(receiver).__name__}({receiver.objectName()!r}): {elapsed}ms"
+            )
+        return ret
+
 def main():
-    setup_logger()
-    
-    app = QApplication(sys.argv)
+    logger = setup_logger()
+
+    argv = list(sys.argv)
+    if "--profile-events" in argv:
+        argv.remove("--profile-events")
+        app = ProfiledApp(argv, logger)
+    else:
+        app = QApplication(argv)
     app.setStyle("Fusion") 
 
     window = MainWindow()
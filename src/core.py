@@ -1,12 +1,20 @@
 import re
 import cv2
 import numpy as np
-import pdfplumber
+import pymupdf
 import pytesseract
 from pdf2image import convert_from_path
 from datetime import datetime
 import os
+import json
+import hashlib
+import functools
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+from .utils import setup_logger
+
+logger = setup_logger()
 
 # ---------------- CONFIG ----------------
 pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
@@ -14,6 +22,25 @@ POPPLER_PATH = r"C:\poppler-25.12.0\Library\bin"
 
 OCR_CONFIG = r"--oem 3 --psm 6"
 
+# Documents with less selectable text than this are treated as scanned
+MIN_TEXT_CHARS = 50
+
+# Words whose tops are this close (in points) share a visual line
+LINE_Y_TOLERANCE = 3
+
+# Tesseract subprocesses per invoice. Kept small because the UI already
+# runs one pipeline per core in its upload process pool.
+OCR_THREADS = 2
+
+# Learned per-vendor field positions, keyed by the invoice's GSTINs
+TEMPLATE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "templates"
+)
+# Layouts remembered per vendor; the least recently learned is dropped
+MAX_TEMPLATE_LAYOUTS = 8
+
+AMOUNT_LABELS = ("CGST", "SGST", "Tax", "Sub Total", "Grand Total")
+
 AMOUNT_REGEX = r"(\d{1,3}(?:,\d{3})*\.\d{2})"
 GST_REGEX = r"\d{2}[A-Z]{5}\d{4}[A-Z][1-9A-Z]Z[0-9A-Z]"
 DATE_REGEX = r"\d{2}[/-]\d{2}[/-]\d{4}"
@@ -21,6 +48,31 @@ PAN_REGEX = r"[A-Z]{5}[0-9]{4}[A-Z]"
 IFSC_REGEX = r"[A-Z]{4}0[A-Z0-9]{6}"
 ACCOUNT_REGEX = r"\b\d{9,18}\b"
 
+_AMOUNT_RE = re.compile(AMOUNT_REGEX)
+_GST_RE = re.compile(GST_REGEX)
+_DATE_RE = re.compile(DATE_REGEX)
+_PAN_RE = re.compile(PAN_REGEX)
+_IFSC_RE = re.compile(IFSC_REGEX)
+_ACCOUNT_RE = re.compile(ACCOUNT_REGEX)
+_ITEM_LINE_RE = re.compile(r"\d+\s+.*\d{2}\.\d{2}$")
+_PERCENT_RE = re.compile(r"(\d+)%")
+_CURRENCY_RE = re.compile(r"₹|â‚¹|Rs\.?")
+
+
+@functools.lru_cache(maxsize=None)
+def _keyword_re(keyword):
+    return re.compile(re.escape(keyword), re.I)
+
+
+@functools.lru_cache(maxsize=None)
+def _any_keyword_re(keywords):
+    return re.compile("|".join(map(re.escape, keywords)), re.I)
+
+
+@functools.lru_cache(maxsize=None)
+def _label_re(label):
+    return re.compile(rf"{label}\s*[:\-]?\s*(.+)", re.I)
+
 
 class InvoicePipeline:
     """
@@ -28,6 +80,9 @@ class InvoicePipeline:
     and returns a flat dict ready for Excel export.
     """
 
+    def __init__(self):
+        self._templates = {}
+
     # ================= PUBLIC =================
     def process_invoice(self, pdf_path):
         filename = os.path.basename(pdf_path)
@@ -41,6 +96,9 @@ class InvoicePipeline:
         if not sgst_rate and cgst_rate:
             sgst_rate = cgst_rate
 
+        vendor_gstin = self._first_match(_GST_RE, raw_text)
+        amounts = self._vendor_amounts(lines, self._template_key(raw_text))
+
         return {
             # -------- File / Status --------
             "Filename": filename,
@@ -51,7 +109,7 @@ class InvoicePipeline:
             # -------- Invoice Header --------
             "Invoice Type": self._find_contains(lines, ["TAX INVOICE"]),
             "Invoice No": self._label_value(raw_text, ["Invoice No"]),
-            "Invoice Date": self._first_match(DATE_REGEX, raw_text),
+            "Invoice Date": self._first_match(_DATE_RE, raw_text),
             "Due Date": self._label_value(raw_text, ["Due Date"]),
             "Place of Supply": self._label_value(raw_text, ["Place of Supply"]),
             "Currency": "INR",
@@ -59,8 +117,8 @@ class InvoicePipeline:
             # -------- Vendor --------
             "Vendor Name": self._vendor_name(lines),
             "Vendor Address": self._vendor_address(lines),
-            "Vendor GSTIN": self._first_match(GST_REGEX, raw_text),
-            "Vendor PAN": self._first_match(PAN_REGEX, raw_text),
+            "Vendor GSTIN": vendor_gstin,
+            "Vendor PAN": self._first_match(_PAN_RE, raw_text),
             "Vendor Email": self._label_value(raw_text, ["Email"]),
 
             # -------- Buyer --------
@@ -73,21 +131,21 @@ class InvoicePipeline:
 
             # -------- Taxes --------
             "CGST Rate (%)": cgst_rate,
-            "CGST Amount": self._find_amount(lines, "CGST"),
+            "CGST Amount": amounts["CGST"],
             "SGST Rate (%)": sgst_rate,
-            "SGST Amount": self._find_amount(lines, "SGST"),
-            "Total Tax": self._find_amount(lines, "Tax"),
+            "SGST Amount": amounts["SGST"],
+            "Total Tax": amounts["Tax"],
 
             # -------- Totals --------
-            "Subtotal": self._find_amount(lines, "Sub Total"),
-            "Grand Total": self._find_amount(lines, "Grand Total"),
+            "Subtotal": amounts["Sub Total"],
+            "Grand Total": amounts["Grand Total"],
             "Amount in Words": self._label_value(raw_text, ["Amount in Words"]),
 
             # -------- Bank --------
             "Bank Name": self._label_value(raw_text, ["Bank"]),
             "Account Name": self._label_value(raw_text, ["Account Name"]),
-            "Account Number": self._first_match(ACCOUNT_REGEX, raw_text),
-            "IFSC Code": self._first_match(IFSC_REGEX, raw_text),
+            "Account Number": self._first_match(_ACCOUNT_RE, raw_text),
+            "IFSC Code": self._first_match(_IFSC_RE, raw_text),
             "Branch": self._label_value(raw_text, ["Branch"]),
 
             # -------- Raw Backup --------
@@ -96,23 +154,69 @@ class InvoicePipeline:
 
     # ================= EXTRACTION =================
     def _extract_text(self, path):
-        text = ""
         method = "TEXT"
 
-        with pdfplumber.open(path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+        with pymupdf.open(path) as doc:
+            page_texts = [self._page_text(page) for page in doc]
+            # Pages without any text but with an image are embedded scans;
+            # blank or vector-only pages are left alone
+            scanned = [
+                i for i, page in enumerate(doc, 1)
+                if not page_texts[i - 1].strip() and page.get_images()
+            ]
 
-        if len(text.strip()) < 50:
+        if sum(len(t.strip()) for t in page_texts) < MIN_TEXT_CHARS:
             method = "OCR"
             images = convert_from_path(path, dpi=300, poppler_path=POPPLER_PATH)
-            for img in images:
-                text += self._ocr(img) + "\n"
-
+            page_texts = self._ocr_pages(images)
+        elif scanned:
+            # The text layer is usable on its own, so OCR of the scanned
+            # pages is best effort and never fails the invoice
+            try:
+                images = [
+                    convert_from_path(
+                        path, dpi=300, poppler_path=POPPLER_PATH,
+                        first_page=i, last_page=i
+                    )[0]
+                    for i in scanned
+                ]
+                for i, page_text in zip(scanned, self._ocr_pages(images)):
+                    page_texts[i - 1] = page_text
+            except Exception as e:
+                logger.warning(f"OCR skipped for pages {scanned} of {path}: {e}")
+
+        text = "".join(t + "\n" for t in page_texts if t)
         return self._normalize(text), method
 
+    def _page_text(self, page):
+        # PyMuPDF's "text" mode puts every span on its own line, which splits
+        # a label from its amount in the next table column. Rebuild visual
+        # lines instead: words grouped by their top edge, read left to right
+        words = sorted(page.get_text("words"), key=itemgetter(1, 0))
+
+        lines, line, top = [], [], None
+        for w in words:
+            if line and w[1] - top > LINE_Y_TOLERANCE:
+                lines.append(line)
+                line = []
+            if not line:
+                top = w[1]
+            line.append(w)
+        if line:
+            lines.append(line)
+
+        return "\n".join(
+            " ".join(w[4] for w in sorted(line, key=itemgetter(0)))
+            for line in lines
+        )
+
+    def _ocr_pages(self, images):
+        # Each Tesseract call is a separate subprocess, so pages OCR in parallel
+        if len(images) == 1:
+            return [self._ocr(images[0])]
+        with ThreadPoolExecutor(max_workers=min(OCR_THREADS, len(images))) as pool:
+            return list(pool.map(self._ocr, images))
+
     def _ocr(self, img):
         img = np.array(img)
         gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
@@ -124,20 +228,15 @@ class InvoicePipeline:
         return pytesseract.image_to_string(gray, config=OCR_CONFIG)
 
     def _normalize(self, text):
-        return (
-            text.replace("₹", "INR ")
-                .replace("Rs.", "INR ")
-                .replace("Rs", "INR ")
-                .replace("â‚¹", "INR ")
-        )
+        return _CURRENCY_RE.sub("INR ", text)
 
     # ================= ITEMS =================
     def _extract_items(self, lines):
         sr, desc, hsn, qty, rate, amt = [], [], [], [], [], []
 
         for l in lines:
-            if re.search(r"\d+\s+.*\d{2}\.\d{2}$", l):
-                numbers = re.findall(AMOUNT_REGEX, l)
+            if _ITEM_LINE_RE.search(l):
+                numbers = _AMOUNT_RE.findall(l)
                 if numbers:
                     amt.append(numbers[-1].replace(",", ""))
                     rate.append(numbers[-1].replace(",", ""))
@@ -156,43 +255,158 @@ class InvoicePipeline:
         }
 
     # ================= HELPERS =================
-    def _find_amount(self, lines, keyword):
-        for l in lines:
-            if keyword.lower() in l.lower():
-                m = re.findall(AMOUNT_REGEX, l)
-                if m:
-                    return m[-1].replace(",", "")
-        return ""
+    def _find_amounts(self, lines, keywords, positions=None):
+        # One scan for all labels: each keyword takes the last amount on the
+        # first line that mentions it and carries an amount
+        found = {}
+        pending = list(keywords)
+        any_keyword = _any_keyword_re(keywords)
+
+        for idx, l in enumerate(lines):
+            if not any_keyword.search(l):
+                continue
+            m = _AMOUNT_RE.findall(l)
+            if not m:
+                continue
+
+            amount = m[-1].replace(",", "")
+            for k in [k for k in pending if _keyword_re(k).search(l)]:
+                found[k] = amount
+                pending.remove(k)
+                if positions is not None:
+                    positions[k] = idx
+            if not pending:
+                break
+
+        return {k: found.get(k, "") for k in keywords}
+
+    # ================= VENDOR TEMPLATES =================
+    def _template_key(self, text):
+        # The first GSTIN is often the buyer's own, so key on every GSTIN
+        # on the invoice; with a fixed buyer that pair identifies the vendor
+        return "_".join(sorted(set(_GST_RE.findall(text))))
+
+    def _vendor_amounts(self, lines, key):
+        # Repeat vendors: read amounts straight from the positions learned
+        # for this layout (line count). Labels the template has not seen
+        # are still scanned for, and a moved label falls back to a full scan
+        layout = str(len(lines))
+        templates = self._load_template(key) if key else None
+        positions = (templates or {}).get(layout)
+        if isinstance(positions, dict) and positions:
+            amounts = self._amounts_from_template(lines, positions)
+            if amounts is not None:
+                missing = tuple(k for k in AMOUNT_LABELS if k not in positions)
+                if missing:
+                    found = {}
+                    amounts.update(self._find_amounts(lines, missing, found))
+                    if found:
+                        self._save_template(key, layout, {**positions, **found})
+                return amounts
+
+        positions = {}
+        amounts = self._find_amounts(lines, AMOUNT_LABELS, positions)
+        if key and positions:
+            self._save_template(key, layout, positions)
+        return amounts
+
+    def _amounts_from_template(self, lines, positions):
+        amounts = {k: "" for k in AMOUNT_LABELS}
+        for k, idx in positions.items():
+            if k not in amounts or not isinstance(idx, int) or not 0 <= idx < len(lines):
+                return None
+            keyword = _keyword_re(k)
+            l = lines[idx]
+            m = _AMOUNT_RE.findall(l) if keyword.search(l) else None
+            if not m:
+                return None
+            # The generic scan takes the first matching line; an earlier
+            # match means the template would disagree with it
+            if any(keyword.search(p) and _AMOUNT_RE.search(p) for p in lines[:idx]):
+                return None
+            amounts[k] = m[-1].replace(",", "")
+        return amounts
+
+    def _template_path(self, key):
+        # Hashed so GSTINs are not left in plain file names
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(TEMPLATE_DIR, f"{name}.json")
+
+    def _read_template(self, key):
+        # {line count: {label: line index}} per vendor
+        path = self._template_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                templates = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring vendor template {path}: {e}")
+            return None
+        return templates if isinstance(templates, dict) else None
+
+    def _load_template(self, key):
+        if key not in self._templates:
+            self._templates[key] = self._read_template(key)
+        return self._templates[key]
+
+    def _save_template(self, key, layout, positions):
+        # Merge into what is on disk now, so pool processes learning other
+        # layouts for the same vendor don't drop each other's entries
+        templates = self._read_template(key) or {}
+        if templates.get(layout) == positions:
+            self._templates[key] = templates
+            return
+
+        templates.pop(layout, None)
+        templates[layout] = positions
+        while len(templates) > MAX_TEMPLATE_LAYOUTS:
+            del templates[next(iter(templates))]
+        self._templates[key] = templates
+
+        # Templates only speed up repeat vendors; never fail an invoice here
+        path = self._template_path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(TEMPLATE_DIR, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(templates, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not save vendor template {path}: {e}")
 
     def _find_percent(self, lines, keyword):
+        keyword_re = _keyword_re(keyword)
         for l in lines:
-            if keyword.lower() in l.lower() and "%" in l:
-                m = re.search(r"(\d+)%", l)
+            if "%" in l and keyword_re.search(l):
+                m = _PERCENT_RE.search(l)
                 if m:
                     return m.group(1)
         return ""
 
     def _label_value(self, text, labels):
         for label in labels:
-            m = re.search(rf"{label}\s*[:\-]?\s*(.+)", text, re.I)
+            m = _label_re(label).search(text)
             if m:
                 return m.group(1).split("\n")[0].strip()
         return ""
 
     def _first_match(self, regex, text):
-        m = re.search(regex, text)
+        m = regex.search(text)
         return m.group() if m else ""
 
     def _find_contains(self, lines, keys):
         for l in lines:
+            upper = l.upper()
             for k in keys:
-                if k in l.upper():
+                if k in upper:
                     return k
         return ""
 
     def _vendor_name(self, lines):
         for l in lines:
-            if any(x in l.upper() for x in ["PVT", "LTD", "PRIVATE"]):
+            upper = l.upper()
+            if any(x in upper for x in ["PVT", "LTD", "PRIVATE"]):
                 return l
         return ""
 
@@ -201,23 +415,36 @@ class InvoicePipeline:
 
     def _buyer_name(self, lines):
         for i, l in enumerate(lines):
-            if any(x in l.lower() for x in ["invoice to", "bill to"]):
+            lower = l.lower()
+            if any(x in lower for x in ["invoice to", "bill to"]):
                 return lines[i + 1]
         return ""
 
     def _buyer_address(self, lines):
         for i, l in enumerate(lines):
-            if any(x in l.lower() for x in ["invoice to", "bill to"]):
+            lower = l.lower()
+            if any(x in lower for x in ["invoice to", "bill to"]):
                 return " ".join(lines[i + 2:i + 6])
         return ""
 
     def _buyer_gstin(self, lines):
         for l in lines:
-            if re.search(GST_REGEX, l):
+            if _GST_RE.search(l):
                 return l
         return ""
 
 
+# ================= POOL WORKER =================
+_pipeline = None
+
+def extract_invoice(path):
+    """Extract one invoice inside a pool process, reusing its pipeline."""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = InvoicePipeline()
+    return _pipeline.process_invoice(path)
+
+
 # ================= EXCEL EXPORT =================
 def export_to_excel(rows, output_path):
     """
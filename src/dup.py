@@ -1,7 +1,7 @@
 import re
 import cv2
 import numpy as np
-import pdfplumber
+import pymupdf
 import pytesseract
 from pdf2image import convert_from_path
 from datetime import datetime
@@ -91,9 +91,9 @@ class InvoicePipeline:
         text = ""
         method = "TEXT"
 
-        with pdfplumber.open(path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
+        with pymupdf.open(path) as doc:
+            for page in doc:
+                page_text = page.get_text("text")
                 if page_text:
                     text += page_text + "\n"
 
@@ -1,26 +1,29 @@
 import hashlib
 import os
 import base64
+import functools
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+@functools.lru_cache(maxsize=1)
+def _generate_key():
+    # Password and salt are fixed, so derive once per process and share
+    password = b"WilowLocalSecureKey"
+    salt = b'static_salt_change_in_prod' 
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=480000,
+    )
+    return base64.urlsafe_b64encode(kdf.derive(password))
+
 class SecurityManager:
     def __init__(self):
-        self._key = self._generate_key() 
+        self._key = _generate_key() 
         self._cipher = Fernet(self._key)
 
-    def _generate_key(self):
-        password = b"WilowLocalSecureKey"
-        salt = b'static_salt_change_in_prod' 
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=480000,
-        )
-        return base64.urlsafe_b64encode(kdf.derive(password))
-
     def encrypt_data(self, data: str) -> bytes:
         if not data: return b""
         return self._cipher.encrypt(data.encode())
@@ -34,14 +37,21 @@ class SecurityManager:
 
     @staticmethod
     def get_file_hash(file_path):
-        sha256 = hashlib.sha256()
         with open(file_path, 'rb') as f:
-            while chunk := f.read(8192):
-                sha256.update(chunk)
-        return sha256.hexdigest()
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+
+    @staticmethod
+    def get_file_hash_cached(file_path):
+        # Keyed on mtime and size too, so a modified file is always re-hashed
+        st = os.stat(file_path)
+        return _hash_cached(os.path.abspath(file_path), st.st_mtime_ns, st.st_size)
 
     @staticmethod
     def sanitize_input(text):
         if text and str(text).startswith(('=', '+', '-', '@')):
             return f"'{text}"
-        return text
\ No newline at end of file
+        return text
+
+@functools.lru_cache(maxsize=2048)
+def _hash_cached(path, mtime_ns, size):
+    return SecurityManager.get_file_hash(path)
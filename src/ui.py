@@ -1,88 +1,204 @@
 import os
+import time
 import logging
+import functools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from PySide6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QFileDialog, QTableWidget,
-    QTableWidgetItem, QLabel, QHeaderView, QProgressBar,
-    QFrame, QGraphicsDropShadowEffect, QAbstractItemView
+    QPushButton, QFileDialog, QTableView,
+    QLabel, QHeaderView, QProgressBar,
+    QFrame, QAbstractItemView,
+    QStyledItemDelegate
 )
-from PySide6.QtCore import Qt, QThread, Signal, QTimer, QPropertyAnimation, QPoint, QEasingCurve
-from PySide6.QtGui import QColor
+from PySide6.QtCore import (
+    Qt, QThread, Signal, QTimer, QPropertyAnimation, QPoint, QEasingCurve,
+    QAbstractTableModel, QModelIndex, QRect, QEvent
+)
+from PySide6.QtGui import QColor, QFont, QFontMetrics, QPainter
 
-from src.core import InvoicePipeline, export_to_excel
+from src.core import extract_invoice, export_to_excel
 from .security import SecurityManager
 from .utils import setup_logger
 
 logger = setup_logger()
 
+# Worker results cross to the GUI thread in batches: every
+# PROGRESS_BATCH_SIZE results, or PROGRESS_BATCH_MS after the last emit
+PROGRESS_BATCH_SIZE = 16
+PROGRESS_BATCH_MS = 100
+
+# Toasts are recycled round-robin from a fixed pool
+TOAST_POOL_SIZE = 3
+
+# WILOINVOICE_FAST_UI values that turn fast mode on
+FAST_UI_VALUES = ("1", "true", "yes", "on")
+
+# Upper bound on invoice-processing processes in the upload pool
+MAX_UPLOAD_WORKERS = 8
+
+# Share of the table width given to each column; widths are only
+# recomputed when the table viewport is resized, never per inserted row
+COLUMN_RATIOS = (0.45, 0.35, 0.20)
+
 # ---------------- ASSETS ----------------
 
+_QSS_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', 'assets', 'styles.qss')
+)
+
 class AssetManager:
     @staticmethod
+    @functools.lru_cache(maxsize=1)
     def load_stylesheet():
-        path = os.path.join(os.path.dirname(__file__), '..', 'assets', 'styles.qss')
-        path = os.path.abspath(path)
-        if os.path.exists(path):
-            with open(path, "r") as f:
+        if os.path.exists(_QSS_PATH):
+            with open(_QSS_PATH, "r") as f:
                 return f.read()
         return ""
 
 # ---------------- UI COMPONENTS ----------------
 
-class StatusBadge(QLabel):
-    def __init__(self, text, status_type):
-        super().__init__(text)
-        self.setAlignment(Qt.AlignCenter)
-        colors = {
-            "Processed": ("#dcfce7", "#166534"),
-            "Duplicate": ("#ffedd5", "#9a3412"),
-            "Error":     ("#fee2e2", "#991b1b")
+STATUS_COLORS = {
+    "Processed": ("#dcfce7", "#166534"),
+    "Duplicate": ("#ffedd5", "#9a3412"),
+    "Error":     ("#fee2e2", "#991b1b")
+}
+DEFAULT_STATUS_COLORS = ("#e2e8f0", "#475569")
+
+# Stylesheets are built once at import; widgets only pick one by key.
+# Shadows are a flat offset border rather than a blur effect, which Qt
+# would re-rasterize on every repaint
+_TOAST_COLORS = {
+    "info": "#3b82f6",
+    "success": "#22c55e",
+    "warning": "#f59e0b",
+    "error": "#ef4444"
+}
+TOAST_QSS = {
+    level: f"""
+        QLabel {{
+            background-color: {bg_color};
+            color: white;
+            padding: 12px 16px;
+            border-radius: 6px;
+            border-bottom: 3px solid rgba(0, 0, 0, 40);
+            font-weight: 500;
+        }}
+    """
+    for level, bg_color in {**_TOAST_COLORS, "_default": "#333"}.items()
+}
+
+_STATUS_PILL_STATES = {
+    "idle": "background-color: transparent; color: #64748b;",
+    "working": "background-color: #e0f2fe; color: #0284c7; border: 1px solid #bae6fd;",
+    "success": "background-color: #dcfce7; color: #166534; border: 1px solid #bbf7d0;",
+    "error": "background-color: #fee2e2; color: #991b1b; border: 1px solid #fecaca;"
+}
+_STATUS_PILL_BASE = "padding: 0 16px; border-radius: 14px; font-weight: 600; font-size: 12px;"
+STATUS_PILL_QSS = {
+    state: f"QLabel {{ {_STATUS_PILL_BASE} {style} }}"
+    for state, style in _STATUS_PILL_STATES.items()
+}
+
+class InvoiceModel(QAbstractTableModel):
+    HEADERS = ["Filename", "Vendor Identified", "Status"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []  # (filename, vendor, status)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self._rows[index.row()][index.column()]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def append_rows(self, rows):
+        if not rows:
+            return
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._rows.clear()
+        self.endResetModel()
+
+class StatusDelegate(QStyledItemDelegate):
+    """Paints the status column as a coloured pill; no per-row widgets."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._palette = {
+            status: (QColor(bg), QColor(fg))
+            for status, (bg, fg) in STATUS_COLORS.items()
         }
-        bg, text_col = colors.get(status_type, ("#e2e8f0", "#475569"))
-        self.setStyleSheet(f"""
-            QLabel {{
-                background-color: {bg};
-                color: {text_col};
-                border-radius: 10px;
-                padding: 4px 12px;
-                font-weight: 700;
-                font-size: 11px;
-            }}
-        """)
+        self._default = tuple(QColor(c) for c in DEFAULT_STATUS_COLORS)
+
+        self._font = QFont()
+        self._font.setPixelSize(11)
+        self._font.setWeight(QFont.Bold)
+        self._metrics = QFontMetrics(self._font)
+
+    def paint(self, painter, option, index):
+        status = index.data(Qt.DisplayRole) or ""
+        bg, fg = self._palette.get(status, self._default)
+
+        pill = QRect(
+            0, 0,
+            self._metrics.horizontalAdvance(status) + 24,
+            self._metrics.height() + 8
+        )
+        pill.moveCenter(option.rect.center())
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(bg)
+        painter.drawRoundedRect(pill, 10, 10)
+        painter.setPen(fg)
+        painter.setFont(self._font)
+        painter.drawText(pill, Qt.AlignCenter, status)
+        painter.restore()
 
 class Toast(QLabel):
-    def __init__(self, parent, message, level="info", duration=3000):
+    """Slide-in notification, built once and reused via show_message()."""
+
+    def __init__(self, parent, animated=True):
         super().__init__(parent)
-        self.setText(message)
         self.setWordWrap(True)
         self.setAlignment(Qt.AlignLeft | Qt.AlignVCenter)
+        self.hide()
 
-        color_map = {
-            "info": "#3b82f6",
-            "success": "#22c55e",
-            "warning": "#f59e0b",
-            "error": "#ef4444"
-        }
-        bg_color = color_map.get(level, "#333")
-
-        self.setStyleSheet(f"""
-            QLabel {{
-                background-color: {bg_color};
-                color: white;
-                padding: 12px 16px;
-                border-radius: 6px;
-                font-weight: 500;
-            }}
-        """)
-
-        shadow = QGraphicsDropShadowEffect(self)
-        shadow.setBlurRadius(15)
-        shadow.setColor(QColor(0, 0, 0, 40))
-        shadow.setYOffset(4)
-        self.setGraphicsEffect(shadow)
+        self.anim = None
+        if animated:
+            self.anim = QPropertyAnimation(self, b"pos", self)
+            self.anim.setDuration(300)
+            self.anim.setEasingCurve(QEasingCurve.OutCubic)
+
+        self._hide_timer = QTimer(self)
+        self._hide_timer.setSingleShot(True)
+        self._hide_timer.timeout.connect(self.hide)
 
+    def show_message(self, message, level="info", duration=3000):
+        self.setText(message)
+        self.setStyleSheet(TOAST_QSS.get(level, TOAST_QSS["_default"]))
+
+        self.setFixedWidth(min(400, self.parent().width() - 40))
         self.adjustSize()
-        self.setFixedWidth(min(400, parent.width() - 40))
         self._animate(duration)
 
     def _animate(self, duration):
@@ -92,42 +208,110 @@ class Toast(QLabel):
         start_y = parent.height()
         end_y = parent.height() - self.height() - margin
 
-        self.move(x_pos, start_y)
-        self.show()
+        if self.anim is None:
+            self.move(x_pos, end_y)
+            self.raise_()
+            self.show()
+        else:
+            self.anim.stop()
+            self.move(x_pos, start_y)
+            self.raise_()
+            self.show()
 
-        self.anim = QPropertyAnimation(self, b"pos")
-        self.anim.setDuration(300)
-        self.anim.setStartValue(QPoint(x_pos, start_y))
-        self.anim.setEndValue(QPoint(x_pos, end_y))
-        self.anim.setEasingCurve(QEasingCurve.OutCubic)
-        self.anim.start()
+            self.anim.setStartValue(QPoint(x_pos, start_y))
+            self.anim.setEndValue(QPoint(x_pos, end_y))
+            self.anim.start()
 
-        QTimer.singleShot(duration, lambda: (self.close(), self.deleteLater()))
+        self._hide_timer.start(duration)
 
 # ---------------- WORKER ----------------
 
 class Worker(QThread):
-    progress = Signal(dict, str)
+    progress_batch = Signal(list)  # [(data, status), ...]
     finished = Signal()
 
-    def __init__(self, files):
+    def __init__(self, files, pool):
         super().__init__()
         self.files = files
-        self.pipeline = InvoicePipeline()
+        self.pool = pool
+        # file_hash -> later copies waiting on the first copy's result
+        self._copies = {}
+        self._batch = []
+        self._last_emit = 0.0
 
     def run(self):
+        # Extraction is CPU-bound, so it runs in the window's process pool;
+        # hashing (cached across batches) stays on this thread
+        self._last_emit = time.monotonic()
+
+        futures = {}
         for path in self.files:
             try:
-                data = self.pipeline.process_invoice(path)
-                self.progress.emit(data, "Processed")
-            except Exception as e:
-                logger.error(f"Failed {path}: {e}")
-                self.progress.emit(
-                    {"Filename": os.path.basename(path), "Vendor Name": "N/A"},
-                    "Error"
-                )
+                file_hash = SecurityManager.get_file_hash_cached(path)
+            except OSError as e:
+                self._report_error(path, e)
+                continue
+
+            # Same file twice in one upload: only the first copy is
+            # extracted, the rest wait on its result
+            if file_hash in self._copies:
+                self._copies[file_hash].append(path)
+                continue
+            self._copies[file_hash] = []
+
+            futures[self.pool.submit(extract_invoice, path)] = (path, file_hash)
+
+        pending = set(futures)
+        while pending:
+            if self.isInterruptionRequested():
+                # Window is closing: drop queued files, running ones finish
+                for fut in pending:
+                    fut.cancel()
+                break
+
+            done, pending = wait(
+                pending, timeout=PROGRESS_BATCH_MS / 1000, return_when=FIRST_COMPLETED
+            )
+            for fut in done:
+                path, file_hash = futures.pop(fut)
+                copies = self._copies.pop(file_hash)
+                try:
+                    data = fut.result()
+                except Exception as e:
+                    # Identical bytes fail identically, so don't retry
+                    for failed in (path, *copies):
+                        self._report_error(failed, e)
+                    continue
+
+                self._report(data, "Processed")
+                for copy in copies:
+                    # Full row per copy, so the export keeps one row per file
+                    self._report({**data, "Filename": os.path.basename(copy)}, "Duplicate")
+
+            if time.monotonic() - self._last_emit >= PROGRESS_BATCH_MS / 1000:
+                self._emit_batch()
+
+        self._emit_batch()
         self.finished.emit()
 
+    def _report(self, data, status):
+        self._batch.append((data, status))
+        if len(self._batch) >= PROGRESS_BATCH_SIZE:
+            self._emit_batch()
+
+    def _report_error(self, path, error):
+        logger.error(f"Failed {path}: {error}")
+        self._report(
+            {"Filename": os.path.basename(path), "Vendor Name": "N/A"},
+            "Error"
+        )
+
+    def _emit_batch(self):
+        if self._batch:
+            self.progress_batch.emit(self._batch)
+            self._batch = []
+        self._last_emit = time.monotonic()
+
 # ---------------- MAIN WINDOW ----------------
 
 class MainWindow(QMainWindow):
@@ -136,13 +320,28 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Wilow Invoice Extractor")
         self.resize(1100, 750)
 
+        # Bare-bones window for tests and smoke runs: no stylesheet, a
+        # single toast and no animations
+        self.fast_ui = (
+            os.environ.get("WILOINVOICE_FAST_UI", "").strip().lower() in FAST_UI_VALUES
+        )
+
         self.extracted_rows = []
+        # One extraction pool reused by every upload; started on the first
+        # upload so spawning its processes stays off start-up
+        self._pool = None
+        self.worker = None
 
-        style_content = AssetManager.load_stylesheet()
-        if style_content:
-            self.setStyleSheet(style_content)
+        if not self.fast_ui:
+            style_content = AssetManager.load_stylesheet()
+            if style_content:
+                self.setStyleSheet(style_content)
 
         self._setup_ui()
+        pool_size = 1 if self.fast_ui else TOAST_POOL_SIZE
+        self._toast_pool = deque(
+            Toast(self, animated=not self.fast_ui) for _ in range(pool_size)
+        )
         self._connect_signals()
 
     def _setup_ui(self):
@@ -188,27 +387,23 @@ class MainWindow(QMainWindow):
         # Card
         self.card = QFrame()
         self.card.setObjectName("ContentCard")
-        shadow = QGraphicsDropShadowEffect(self.card)
-        shadow.setBlurRadius(20)
-        shadow.setColor(QColor(0, 0, 0, 15))
-        self.card.setGraphicsEffect(shadow)
 
-        card_layout = QVBoxLayout(self.card)
+        self.card_layout = card_layout = QVBoxLayout(self.card)
         card_layout.setContentsMargins(24, 24, 24, 24)
 
         lbl_card = QLabel("Processed Queue")
         lbl_card.setObjectName("CardTitle")
         card_layout.addWidget(lbl_card)
 
-        self.table = QTableWidget(0, 3)
-        self.table.setHorizontalHeaderLabels(["Filename", "Vendor Identified", "Status"])
-        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.table.verticalHeader().setVisible(False)
-        self.table.setShowGrid(False)
-        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
-        self.table.setFocusPolicy(Qt.NoFocus)
+        # The table is built on the first results (see _ensure_table);
+        # until then the card only holds a placeholder
+        self.model = InvoiceModel(self)
+        self.table = None
+        self.empty_label = QLabel("No invoices yet")
+        self.empty_label.setObjectName("EmptyState")
+        self.empty_label.setAlignment(Qt.AlignCenter)
 
-        card_layout.addWidget(self.table)
+        card_layout.addWidget(self.empty_label, 1)
         main_layout.addWidget(self.card)
 
         # Footer
@@ -229,23 +424,70 @@ class MainWindow(QMainWindow):
         f_layout.addStretch()
         main_layout.addWidget(footer)
 
+    def _ensure_table(self):
+        if self.table is not None:
+            return
+
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setItemDelegateForColumn(2, StatusDelegate(self.table))
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setShowGrid(False)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setFocusPolicy(Qt.NoFocus)
+        self.table.viewport().installEventFilter(self)
+
+        self.card_layout.replaceWidget(self.empty_label, self.table)
+        self.card_layout.setStretchFactor(self.table, 1)
+        self.empty_label.deleteLater()
+        self.empty_label = None
+        # Column widths are set by eventFilter once the new table is shown
+        # and its viewport gets its real size
+
+    def _fit_columns(self):
+        if self.table is None:
+            return
+        width = self.table.viewport().width()
+        for col, ratio in enumerate(COLUMN_RATIOS):
+            self.table.setColumnWidth(col, int(width * ratio))
+
+    def eventFilter(self, obj, event):
+        # The viewport resizes with the window and also when the vertical
+        # scrollbar comes or goes, so refit on every viewport resize
+        if (
+            event.type() == QEvent.Resize
+            and self.table is not None
+            and obj is self.table.viewport()
+        ):
+            self._fit_columns()
+        return super().eventFilter(obj, event)
+
+    def closeEvent(self, event):
+        # Extractions already running are waited on below; hide first so
+        # the window doesn't sit frozen until they finish
+        self.hide()
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.requestInterruption()
+            self.worker.wait()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+        super().closeEvent(event)
+
     def _connect_signals(self):
         self.btn_upload.clicked.connect(self.upload_files)
         self.btn_export.clicked.connect(self.export_data)
 
     def show_toast(self, message, level="info"):
-        Toast(self, message, level)
+        # Reuse the least recently shown toast
+        toast = self._toast_pool.popleft()
+        self._toast_pool.append(toast)
+        toast.show_message(message, level)
 
     def update_status_pill(self, message, state="idle"):
         self.lbl_status.setText(message)
-        styles = {
-            "idle": "background-color: transparent; color: #64748b;",
-            "working": "background-color: #e0f2fe; color: #0284c7; border: 1px solid #bae6fd;",
-            "success": "background-color: #dcfce7; color: #166534; border: 1px solid #bbf7d0;",
-            "error": "background-color: #fee2e2; color: #991b1b; border: 1px solid #fecaca;"
-        }
-        base = "padding: 0 16px; border-radius: 14px; font-weight: 600; font-size: 12px;"
-        self.lbl_status.setStyleSheet(f"QLabel {{ {base} {styles.get(state)} }}")
+        self.lbl_status.setStyleSheet(STATUS_PILL_QSS.get(state, STATUS_PILL_QSS["idle"]))
 
     # ---------------- ACTIONS ----------------
 
@@ -257,32 +499,44 @@ class MainWindow(QMainWindow):
             return
 
         self.extracted_rows.clear()
-        self.table.setRowCount(0)
+        self.model.clear()
 
         self.progress_bar.setVisible(True)
-        self.progress_bar.setRange(0, 0)
+        # Determinate range: an indeterminate bar repaints continuously
+        self.progress_bar.setRange(0, len(files))
+        self.progress_bar.setValue(0)
         self.update_status_pill("Processing invoices...", "working")
         self.btn_upload.setEnabled(False)
         self.btn_export.setEnabled(False)
 
-        self.worker = Worker(files)
-        self.worker.progress.connect(self.handle_progress)
-        self.worker.finished.connect(self.handle_finished)
+        if self._pool is None:
+            # spawn, not fork: this process already has Qt threads running
+            self._pool = ProcessPoolExecutor(
+                max_workers=min(MAX_UPLOAD_WORKERS, os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        self.worker = Worker(files, self._pool)
+        # Cross-thread: queue explicitly instead of relying on AutoConnection
+        self.worker.progress_batch.connect(self.handle_progress, Qt.QueuedConnection)
+        self.worker.finished.connect(self.handle_finished, Qt.QueuedConnection)
         self.worker.start()
 
-    def handle_progress(self, data, status):
-        row = self.table.rowCount()
-        self.table.insertRow(row)
-
-        fname = data.get("Filename", "Unknown")
-        vendor = data.get("Vendor Name", "Unknown")
+    def handle_progress(self, batch):
+        rows = []
+        for data, status in batch:
+            self.extracted_rows.append(data)
+            rows.append((
+                data.get("Filename", "Unknown"),
+                data.get("Vendor Name", "Unknown"),
+                status
+            ))
 
-        self.table.setItem(row, 0, QTableWidgetItem(fname))
-        self.table.setItem(row, 1, QTableWidgetItem(vendor))
-        self.table.setCellWidget(row, 2, StatusBadge(status, status))
+        self._ensure_table()
 
-        self.extracted_rows.append(data)
+        # One rowsInserted notification and repaint for the whole batch
+        self.model.append_rows(rows)
         self.table.scrollToBottom()
+        self.progress_bar.setValue(self.model.rowCount())
 
     def handle_finished(self):
         self.progress_bar.setVisible(False)
@@ -0,0 +1,138 @@
+import json
+
+import pymupdf
+import pytest
+
+from src import core
+from src.core import InvoicePipeline
+
+VENDOR = "29ABCDE1234F1Z5"
+BUYER = "27PQRSX6789K1Z2"
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(core, "TEMPLATE_DIR", str(tmp_path))
+    return InvoicePipeline()
+
+
+def _invoice(*amount_lines):
+    return ["ACME PVT LTD", f"GSTIN {VENDOR}", f"Bill To GSTIN {BUYER}", *amount_lines]
+
+
+def test_template_key_uses_every_gstin(pipeline):
+    text = "\n".join(_invoice())
+    assert pipeline._template_key(text) == f"{BUYER}_{VENDOR}"
+    assert pipeline._template_key("no tax ids here") == ""
+
+
+def test_template_scans_labels_it_has_not_learned(pipeline):
+    key = f"{BUYER}_{VENDOR}"
+    first = _invoice("Item 1 100.00", "Grand Total 118.00", "Thank you")
+    second = _invoice("CGST 9% 9.00", "SGST 9% 9.00", "Grand Total 118.00")
+
+    assert pipeline._vendor_amounts(first, key)["Grand Total"] == "118.00"
+
+    amounts = pipeline._vendor_amounts(second, key)
+    assert amounts["CGST"] == "9.00"
+    assert amounts["SGST"] == "9.00"
+    assert amounts["Grand Total"] == "118.00"
+
+    # Newly found labels are learned for the next invoice with this layout
+    with open(pipeline._template_path(key), encoding="utf-8") as f:
+        saved = json.load(f)
+    assert saved[str(len(second))] == {"Grand Total": 5, "CGST": 3, "SGST": 4}
+
+
+def test_template_falls_back_when_layout_moves(pipeline):
+    key = f"{BUYER}_{VENDOR}"
+    pipeline._vendor_amounts(_invoice("Sub Total 100.00", "Grand Total 118.00"), key)
+
+    # Same line count, but the labels have swapped lines
+    amounts = pipeline._vendor_amounts(_invoice("Grand Total 236.00", "Sub Total 200.00"), key)
+    assert amounts["Sub Total"] == "200.00"
+    assert amounts["Grand Total"] == "236.00"
+
+
+def test_templates_are_kept_per_layout(pipeline):
+    key = f"{BUYER}_{VENDOR}"
+    short = _invoice("Grand Total 118.00")
+    long = _invoice("CGST 9.00", "SGST 9.00", "Grand Total 118.00")
+
+    pipeline._vendor_amounts(short, key)
+    pipeline._vendor_amounts(long, key)
+
+    templates = InvoicePipeline()._load_template(key)
+    assert set(templates) == {str(len(short)), str(len(long))}
+
+
+def test_template_agrees_with_first_matching_line(pipeline):
+    key = f"{BUYER}_{VENDOR}"
+    pipeline._vendor_amounts(["x", "y", "Grand Total 100.00"], key)
+
+    amounts = pipeline._vendor_amounts(["Grand Total 50.00", "x", "Grand Total 100.00"], key)
+    assert amounts["Grand Total"] == "50.00"
+
+
+def test_template_writes_merge_across_pipelines(pipeline):
+    # Two pool processes, each with its own cached view of the template
+    key = f"{BUYER}_{VENDOR}"
+    other = InvoicePipeline()
+    other._load_template(key)
+
+    short = _invoice("Grand Total 118.00")
+    long = _invoice("CGST 9.00", "SGST 9.00", "Grand Total 118.00")
+    pipeline._vendor_amounts(short, key)
+    other._vendor_amounts(long, key)
+
+    assert set(InvoicePipeline()._load_template(key)) == {str(len(short)), str(len(long))}
+
+
+def test_template_layouts_are_capped(pipeline, monkeypatch):
+    monkeypatch.setattr(core, "MAX_TEMPLATE_LAYOUTS", 2)
+    key = f"{BUYER}_{VENDOR}"
+    for n in range(4):
+        pipeline._vendor_amounts(["x"] * n + ["Grand Total 118.00"], key)
+
+    assert list(pipeline._read_template(key)) == ["3", "4"]
+
+
+def test_template_file_name_hides_gstin(pipeline):
+    assert VENDOR not in pipeline._template_path(f"{BUYER}_{VENDOR}")
+
+
+def test_unwritable_template_dir_does_not_fail_invoice(tmp_path, monkeypatch):
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("")
+    monkeypatch.setattr(core, "TEMPLATE_DIR", str(blocker / "templates"))
+
+    amounts = InvoicePipeline()._vendor_amounts(_invoice("Grand Total 118.00"), f"{BUYER}_{VENDOR}")
+    assert amounts["Grand Total"] == "118.00"
+
+
+def test_native_pdf_keeps_label_and_amount_columns_on_one_line(pipeline, tmp_path):
+    # Labels and amounts sit in separate table columns, as in most invoices
+    doc = pymupdf.open()
+    page = doc.new_page()
+    page.insert_text((50, 60), "TAX INVOICE")
+    page.insert_text((50, 80), "ACME PRIVATE LIMITED, 12 Industrial Estate, Pune")
+    rows = [
+        ("Sub Total", "100.00"),
+        ("CGST 9%", "9.00"),
+        ("SGST 9%", "9.00"),
+        ("Grand Total", "118.00"),
+    ]
+    for i, (label, amount) in enumerate(rows):
+        y = 200 + 20 * i
+        page.insert_text((50, y), label)
+        page.insert_text((400, y), amount)
+    path = tmp_path / "columns.pdf"
+    doc.save(path)
+    doc.close()
+
+    data = pipeline.process_invoice(str(path))
+    assert data["OCR Method"] == "TEXT"
+    assert data["Subtotal"] == "100.00"
+    assert data["CGST Amount"] == "9.00"
+    assert data["SGST Amount"] == "9.00"
+    assert data["Grand Total"] == "118.00"